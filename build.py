@@ -0,0 +1,28 @@
+"""Build the optional Cython extensions, the package falls back to NumPy without them.
+
+poetry-core calls `build` when building a wheel, while `poetry install` runs this
+file as a script, which builds the extensions in place in `src`.
+"""
+
+
+def build(setup_kwargs):
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        return
+    setup_kwargs.update(
+        ext_modules=cythonize(["src/fasttext_lite/_reorder.pyx"]),
+        zip_safe=False,
+    )
+
+
+if __name__ == "__main__":
+    from setuptools import Distribution
+
+    setup_kwargs = {"package_dir": {"": "src"}}
+    build(setup_kwargs)
+    if "ext_modules" in setup_kwargs:
+        distribution = Distribution(setup_kwargs)
+        build_ext = distribution.get_command_obj("build_ext")
+        build_ext.inplace = True
+        distribution.run_command("build_ext")
@@ -0,0 +1,386 @@
+"""A NumPy reader for fastText `.bin` supervised models that memory-maps the weights.
+
+`fasttext.load_model` copies the whole model into process memory, which for a
+model with a large `bucket` is gigabytes per worker. Here the input and output
+matrices are read-only views into a memory map of the file, so pages are loaded
+lazily and shared by every process mapping the same file. The dictionary,
+tokenization and hashing mirror fastText's `Dictionary::getLine` so the
+predictions match those of the fastText library.
+"""
+
+import mmap
+import re
+import shutil
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+FASTTEXT_FILEFORMAT_MAGIC_INT32 = 793712314
+FASTTEXT_VERSION = 12
+
+EOS = "</s>"
+BOW = "<"
+EOW = ">"
+
+# fastText's `loss_name` enum
+LOSS_HS = 1
+LOSS_NS = 2
+LOSS_SOFTMAX = 3
+LOSS_OVA = 4
+
+# fastText's `model_name` enum
+MODEL_SUP = 3
+
+# fastText approximates the sigmoid of binary logistic losses with a lookup table
+SIGMOID_TABLE_SIZE = 512
+MAX_SIGMOID = 8
+_SIGMOID_TABLE = 1.0 / (
+    1.0
+    + np.exp(
+        -(
+            np.arange(SIGMOID_TABLE_SIZE + 1) * 2 * MAX_SIGMOID / SIGMOID_TABLE_SIZE
+            - MAX_SIGMOID
+        )
+    )
+)
+
+# fastText splits on these characters only, not on every unicode whitespace
+_WHITESPACE = re.compile(rb"[ \n\r\t\v\f\x00]+")
+
+# The multiplier of fastText's word n-gram hash
+_NGRAM_HASH_MULTIPLIER = np.uint64(116049371)
+
+# The per-token cache of a dictionary is cleared when it grows past this
+_MAX_CACHED_TOKENS = 1 << 20
+
+# Cached for tokens that are labels, which fastText drops from the input
+_LABEL_TOKEN = None
+_NOT_CACHED = object()
+
+
+def fasttext_hash(data: bytes) -> int:
+    """The 32 bit FNV-1a hash of fastText, including its sign extension of bytes"""
+    h = 2166136261
+    for byte in data:
+        if byte >= 0x80:
+            byte |= 0xFFFFFF00
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def supports_mmap(path: Union[str, Path]) -> bool:
+    """Whether `MmapFastText` can load the model at `path`, from its loss"""
+    fmt = "<ii12i"
+    with open(path, "rb") as f:
+        header = f.read(struct.calcsize(fmt))
+    if len(header) < struct.calcsize(fmt):
+        return False
+    values = struct.unpack(fmt, header)
+    return values[0] == FASTTEXT_FILEFORMAT_MAGIC_INT32 and values[8] in (
+        LOSS_NS,
+        LOSS_SOFTMAX,
+        LOSS_OVA,
+    )
+
+
+def _to_int32(value: int) -> int:
+    return value - (1 << 32) if value >= (1 << 31) else value
+
+
+class Dictionary:
+    """Maps a line of text to the input matrix rows fastText averages for it"""
+
+    def __init__(
+        self,
+        words: List[str],
+        labels: List[str],
+        bucket: int,
+        minn: int,
+        maxn: int,
+        word_ngrams: int,
+        pruneidx: Optional[Dict[int, int]] = None,
+        label: str = "__label__",
+    ):
+        self.words = words
+        self.nwords = len(words)
+        self.bucket = bucket
+        self.minn = minn
+        self.maxn = maxn
+        self.word_ngrams = word_ngrams
+        # None means not pruned, an empty dict means every hash was pruned
+        self.pruneidx = pruneidx
+        self.label = label
+        self.word2id = {word: i for i, word in enumerate(words)}
+        self.labels = set(labels)
+        # The ids and hash of each token, computed on first use since hashing the
+        # character n-grams of every word in Python is slow
+        self._tokens: Dict[bytes, Optional[Tuple[List[int], int]]] = {}
+
+    def _push_hash(self, ids: List[int], bucket_id: int) -> None:
+        if self.pruneidx is not None:
+            if bucket_id not in self.pruneidx:
+                return
+            bucket_id = self.pruneidx[bucket_id]
+        ids.append(self.nwords + bucket_id)
+
+    def _compute_subwords(self, word: bytes, ids: List[int]) -> None:
+        for i in range(len(word)):
+            # Only start character n-grams on the first byte of a UTF-8 character
+            if (word[i] & 0xC0) == 0x80:
+                continue
+            j = i
+            n = 1
+            while j < len(word) and n <= self.maxn:
+                j += 1
+                while j < len(word) and (word[j] & 0xC0) == 0x80:
+                    j += 1
+                if n >= self.minn and not (n == 1 and (i == 0 or j == len(word))):
+                    self._push_hash(ids, fasttext_hash(word[i:j]) % self.bucket)
+                n += 1
+
+    def _token(self, token: bytes) -> Optional[Tuple[List[int], int]]:
+        """The word and character n-gram ids and the hash of a token, None for labels"""
+        word = token.decode(errors="replace")
+        wid = self.word2id.get(word, -1)
+        if word in self.labels or (wid < 0 and word.startswith(self.label)):
+            return _LABEL_TOKEN
+        ids = [wid] if wid >= 0 else []
+        if word != EOS and self.maxn > 0:
+            self._compute_subwords(BOW.encode() + token + EOW.encode(), ids)
+        return ids, _to_int32(fasttext_hash(token))
+
+    def get_line(self, text: str) -> List[int]:
+        """The input ids of one line of text, as fastText's `predict` computes them"""
+        ids, _ = self.get_lines([text])
+        return ids.tolist()
+
+    def get_lines(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """The input ids of many lines, back to back, and the `len(texts) + 1`
+        boundaries of each line's ids. The ids of a line are in fastText's order."""
+        tokens = self._tokens
+        eos = EOS.encode()
+        word_ids: List[int] = []
+        hashes: List[int] = []
+        n_word_ids = np.zeros(len(texts), dtype=np.int64)
+        n_hashes = np.zeros(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            line_start = len(word_ids)
+            hashes_start = len(hashes)
+            for token in _WHITESPACE.split(text.encode()) + [eos]:
+                if not token:
+                    continue
+                entry = tokens.get(token, _NOT_CACHED)
+                if entry is _NOT_CACHED:
+                    if len(tokens) >= _MAX_CACHED_TOKENS:
+                        tokens.clear()
+                    entry = tokens[token] = self._token(token)
+                if entry is _LABEL_TOKEN:
+                    continue
+                word_ids.extend(entry[0])
+                hashes.append(entry[1])
+            n_word_ids[i] = len(word_ids) - line_start
+            n_hashes[i] = len(hashes) - hashes_start
+        ids = np.array(word_ids, dtype=np.int64)
+        lines = np.repeat(np.arange(len(texts)), n_word_ids)
+        if self.word_ngrams > 1 and hashes:
+            ngram_ids, ngram_lines, ngram_order = self._word_ngrams(
+                np.array(hashes, dtype=np.int64), n_hashes
+            )
+            # Each line's word n-grams follow its words, as in fastText
+            order = np.lexsort(
+                (
+                    np.concatenate([np.arange(len(ids)), ngram_order]),
+                    np.concatenate(
+                        [np.zeros(len(ids), np.int8), np.ones(len(ngram_ids), np.int8)]
+                    ),
+                    np.concatenate([lines, ngram_lines]),
+                )
+            )
+            ids = np.concatenate([ids, ngram_ids])[order]
+            lines = np.concatenate([lines, ngram_lines])[order]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(lines, minlength=len(texts)))
+        return ids, offsets
+
+    def _word_ngrams(
+        self, hashes: np.ndarray, n_hashes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The word n-gram ids of the token hashes of every line at once, their
+        lines and their position, by first token then length, within the line"""
+        token_lines = np.repeat(np.arange(len(n_hashes)), n_hashes)
+        # fastText adds the int32 hashes to a uint64, so they are sign extended
+        unsigned = hashes.astype(np.uint64)
+        h = unsigned.copy()
+        all_ids, all_lines, all_order = [], [], []
+        with np.errstate(over="ignore"):
+            for n in range(1, self.word_ngrams):
+                # `h[i]` becomes the hash of tokens `i` to `i + n`
+                h = h[:-1] * _NGRAM_HASH_MULTIPLIER + unsigned[n:]
+                starts = np.flatnonzero(token_lines[:-n] == token_lines[n:])
+                ngram_ids = (h[starts] % np.uint64(self.bucket)).astype(np.int64)
+                all_ids.append(ngram_ids)
+                all_lines.append(token_lines[starts])
+                all_order.append(starts * self.word_ngrams + n)
+        ids = np.concatenate(all_ids)
+        lines = np.concatenate(all_lines)
+        order = np.concatenate(all_order)
+        if self.pruneidx is not None:
+            keys = np.array(sorted(self.pruneidx), dtype=np.int64)
+            kept = np.isin(ids, keys)
+            ids, lines, order = ids[kept], lines[kept], order[kept]
+            ids = np.array([self.pruneidx[i] for i in ids.tolist()], dtype=np.int64)
+        return ids + self.nwords, lines, order
+
+
+class MmapFastText:
+    """A read-only fastText supervised model backed by a memory-mapped `.bin` file.
+
+    Implements the subset of `fasttext.FastText._FastText` used by the classifiers.
+    Quantized (`.ftz`) models and the hierarchical softmax loss are not supported.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._pos = 0
+        magic, version = self._unpack("<ii")
+        if magic != FASTTEXT_FILEFORMAT_MAGIC_INT32 or version > FASTTEXT_VERSION:
+            raise ValueError(f"{self.path} is not a supported fastText model.")
+        (
+            self.dim,
+            _ws,
+            _epoch,
+            _min_count,
+            _neg,
+            word_ngrams,
+            self.loss,
+            model,
+            bucket,
+            minn,
+            maxn,
+            _lr_update_rate,
+            _t,
+        ) = self._unpack("<12id")
+        if model != MODEL_SUP:
+            raise ValueError(f"{self.path} is not a supervised fastText model.")
+        if self.loss not in (LOSS_NS, LOSS_SOFTMAX, LOSS_OVA):
+            raise ValueError("Memory-mapped loading does not support the `hs` loss.")
+        if version == 11:
+            maxn = 0
+
+        size, _nwords, _nlabels, _ntokens, pruneidx_size = self._unpack("<iiiqq")
+        words: List[str] = []
+        self._labels: List[str] = []
+        for _ in range(size):
+            end = self._buffer.find(b"\x00", self._pos)
+            entry = self._buffer[self._pos : end].decode(errors="replace")
+            self._pos = end + 1
+            _count, entry_type = self._unpack("<qb")
+            (self._labels if entry_type == 1 else words).append(entry)
+        pruneidx = None
+        if pruneidx_size >= 0:
+            pairs = self._unpack(f"<{2 * pruneidx_size}i")
+            pruneidx = dict(zip(pairs[::2], pairs[1::2]))
+        self.dictionary = Dictionary(
+            words, self._labels, bucket, minn, maxn, word_ngrams, pruneidx
+        )
+        # The same arguments fastText's model exposes
+        self.bucket = bucket
+        self.minn = minn
+        self.maxn = maxn
+        self.wordNgrams = word_ngrams
+
+        self._input = self._map_matrix()
+        self._output = self._map_matrix()
+
+    def _unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self._buffer, self._pos)
+        self._pos += struct.calcsize(fmt)
+        return values
+
+    def _map_matrix(self) -> np.ndarray:
+        (quantized,) = self._unpack("<?")
+        if quantized:
+            raise ValueError("Memory-mapped loading does not support quantized models.")
+        rows, cols = self._unpack("<qq")
+        matrix = np.frombuffer(
+            self._buffer, dtype=np.float32, count=rows * cols, offset=self._pos
+        ).reshape(rows, cols)
+        self._pos += matrix.nbytes
+        return matrix
+
+    def is_quantized(self) -> bool:
+        return False
+
+    def get_dimension(self) -> int:
+        return self.dim
+
+    def get_words(self) -> List[str]:
+        return self.dictionary.words
+
+    def get_labels(self) -> List[str]:
+        return self._labels
+
+    def get_input_matrix(self) -> np.ndarray:
+        return self._input
+
+    def get_output_matrix(self) -> np.ndarray:
+        return self._output
+
+    def save_model(self, path: str) -> None:
+        shutil.copyfile(self.path, path)
+
+    def quantize(self, *args, **kwargs) -> None:
+        raise ValueError(
+            "Memory-mapped models can't be quantized, load with `mmap=False`."
+        )
+
+    def _predict_probs(self, text: List[str]) -> np.ndarray:
+        if any("\n" in line for line in text):
+            raise ValueError("predict processes one line at a time (remove '\\n')")
+        ids, offsets = self.dictionary.get_lines(text)
+        lengths = np.diff(offsets)
+        # A sparse product adds up the rows of each line in place like fastText does,
+        # without gathering a copy of every vector first
+        counts = sparse.csr_matrix(
+            (np.ones(len(ids), dtype=np.float32), ids, offsets),
+            shape=(len(text), self._input.shape[0]),
+        )
+        hidden = np.asarray(counts @ self._input, dtype=np.float32)
+        # fastText scales the sums by the float of 1 / n_ids
+        hidden *= (1.0 / np.maximum(lengths, 1)[:, None]).astype(np.float32)
+        scores = hidden @ self._output.T
+        if self.loss == LOSS_SOFTMAX:
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        else:
+            table_idx = (scores + MAX_SIGMOID) * SIGMOID_TABLE_SIZE / MAX_SIGMOID / 2
+            table_idx = np.clip(table_idx, 0, SIGMOID_TABLE_SIZE).astype(np.int64)
+            probs = _SIGMOID_TABLE[table_idx].astype(np.float32)
+            probs[scores < -MAX_SIGMOID] = 0.0
+            probs[scores > MAX_SIGMOID] = 1.0
+            scores = probs
+        # fastText ranks on log(p + 1e-5) and returns exp of that
+        return scores + np.float32(1e-5)
+
+    def predict(
+        self, text: Union[str, List[str]], k: int = 1, threshold: float = 0.0
+    ) -> Tuple[Union[tuple, list], Union[np.ndarray, list]]:
+        """As fastText's `predict`, a single str gives a tuple of labels and an array"""
+        lines = [text] if isinstance(text, str) else text
+        probs = self._predict_probs(lines)
+        k = len(self._labels) if k == -1 else min(k, len(self._labels))
+        top = np.argsort(-probs, axis=1, kind="stable")[:, :k]
+        all_labels = []
+        all_probs = []
+        for row, idxs in zip(probs, top):
+            idxs = idxs[row[idxs] >= threshold]
+            all_labels.append([self._labels[i] for i in idxs])
+            all_probs.append(row[idxs])
+        if isinstance(text, str):
+            return tuple(all_labels[0]), all_probs[0]
+        return all_labels, all_probs
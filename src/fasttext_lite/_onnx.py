@@ -0,0 +1,161 @@
+"""Export a fastText supervised model to ONNX and predict with ONNX Runtime.
+
+The graph takes the padded input ids of a batch of lines, with per-id weights
+of `1 / n_ids` (0 for padding), and computes the mean of their input vectors,
+the output scores and their softmax or sigmoid. The columns of the output are
+in the order of the classifier's `classes_`. The dictionary is stored in the
+model's metadata, so tokenization and hashing don't need the fastText library.
+"""
+
+import json
+from pathlib import Path
+from typing import List, Sequence, Union
+
+import numpy as np
+
+from ._mmap import Dictionary
+
+OPSET_VERSION = 13
+# The IR version of opset 13, so older ONNX Runtime releases can load the model
+IR_VERSION = 7
+METADATA_KEY = "fasttext_lite"
+# Protobuf can't serialize messages over 2GB, larger weights go in a side file
+MAX_EMBEDDED_BYTES = 2**31 - 2**26
+# Padded ids whose input vectors are gathered per run, so memory stays bounded by
+# this many rows of the input matrix whatever the size of the batch
+MAX_GATHERED_IDS = 16384
+
+
+def export_model(
+    path: Union[str, Path],
+    input_matrix: np.ndarray,
+    output_matrix: np.ndarray,
+    sigmoid: bool,
+    dictionary: Dictionary,
+    classes: Sequence[str],
+):
+    """Save a fastText model to ONNX, `output_matrix` has a row per class"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    nodes = [
+        helper.make_node("Gather", ["input_matrix", "ids"], ["vectors"], axis=0),
+        helper.make_node("Unsqueeze", ["weights", "last_axis"], ["weights_3d"]),
+        helper.make_node("Mul", ["vectors", "weights_3d"], ["weighted"]),
+        helper.make_node("ReduceSum", ["weighted", "ids_axis"], ["hidden"], keepdims=0),
+        helper.make_node("MatMul", ["hidden", "output_matrix_t"], ["scores"]),
+        (
+            helper.make_node("Sigmoid", ["scores"], ["probs"])
+            if sigmoid
+            else helper.make_node("Softmax", ["scores"], ["probs"], axis=1)
+        ),
+    ]
+    initializers = [
+        numpy_helper.from_array(
+            np.ascontiguousarray(input_matrix, dtype=np.float32), "input_matrix"
+        ),
+        numpy_helper.from_array(
+            np.ascontiguousarray(output_matrix.T, dtype=np.float32), "output_matrix_t"
+        ),
+        numpy_helper.from_array(np.array([2], dtype=np.int64), "last_axis"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "ids_axis"),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "fasttext",
+        [
+            helper.make_tensor_value_info("ids", TensorProto.INT64, ["batch", "ids"]),
+            helper.make_tensor_value_info(
+                "weights", TensorProto.FLOAT, ["batch", "ids"]
+            ),
+        ],
+        [
+            helper.make_tensor_value_info(
+                "probs", TensorProto.FLOAT, ["batch", len(classes)]
+            )
+        ],
+        initializers,
+    )
+    model = helper.make_model(
+        graph,
+        opset_imports=[helper.make_opsetid("", OPSET_VERSION)],
+        ir_version=IR_VERSION,
+    )
+    pruneidx = dictionary.pruneidx
+    metadata = {
+        "classes": list(classes),
+        "words": dictionary.words,
+        "labels": sorted(dictionary.labels),
+        "bucket": dictionary.bucket,
+        "minn": dictionary.minn,
+        "maxn": dictionary.maxn,
+        "word_ngrams": dictionary.word_ngrams,
+        "pruneidx": None if pruneidx is None else list(pruneidx.items()),
+        "label": dictionary.label,
+    }
+    helper.set_model_props(model, {METADATA_KEY: json.dumps(metadata)})
+    weights_nbytes = input_matrix.nbytes + output_matrix.nbytes
+    onnx.save_model(
+        model,
+        str(path),
+        save_as_external_data=weights_nbytes > MAX_EMBEDDED_BYTES,
+        location=f"{Path(path).name}.data",
+    )
+
+
+class OnnxPredictor:
+    """Class probabilities of lines of text from a model written by `export_model`"""
+
+    def __init__(self, path: Union[str, Path]):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(
+            str(path), providers=["CPUExecutionProvider"]
+        )
+        metadata = json.loads(
+            self.session.get_modelmeta().custom_metadata_map[METADATA_KEY]
+        )
+        pruneidx = metadata["pruneidx"]
+        self.classes: List[str] = metadata["classes"]
+        self.dictionary = Dictionary(
+            metadata["words"],
+            metadata["labels"],
+            metadata["bucket"],
+            metadata["minn"],
+            metadata["maxn"],
+            metadata["word_ngrams"],
+            None if pruneidx is None else dict(pruneidx),
+            metadata["label"],
+        )
+
+    def predict_proba(self, X: List[str]) -> np.ndarray:
+        ids, offsets = self.dictionary.get_lines(X)
+        lengths = np.diff(offsets)
+        probs = np.empty((len(X), len(self.classes)), dtype=np.float32)
+        # The graph gathers a `batch x width x dim` tensor, so lines of similar
+        # lengths are padded and run together in chunks of bounded size
+        by_length = np.argsort(lengths, kind="stable")
+        end = len(X)
+        while end > 0:
+            width = max(int(lengths[by_length[end - 1]]), 1)
+            # A line longer than the budget is run on its own
+            start = max(end - max(MAX_GATHERED_IDS // width, 1), 0)
+            rows = by_length[start:end]
+            probs[rows] = self._run(ids, offsets[rows], lengths[rows], width)
+            end = start
+        return probs
+
+    def _run(
+        self, ids: np.ndarray, starts: np.ndarray, lengths: np.ndarray, width: int
+    ) -> np.ndarray:
+        """The probabilities of the lines whose ids start at `starts`"""
+        mask = np.arange(width) < lengths[:, None]
+        # The index in `ids` of every id of the lines, line after line
+        line_ids = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        line_ids += np.arange(len(line_ids))
+        padded_ids = np.zeros((len(lengths), width), dtype=np.int64)
+        padded_ids[mask] = ids[line_ids]
+        weights = np.zeros((len(lengths), width), dtype=np.float32)
+        weights[mask] = np.repeat(1 / lengths[lengths > 0], lengths[lengths > 0])
+        (probs,) = self.session.run(["probs"], {"ids": padded_ids, "weights": weights})
+        return probs
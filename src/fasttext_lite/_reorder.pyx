@@ -0,0 +1,22 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Scatter fastText's probabilities, sorted in descending order, into class order"""
+
+
+def reorder(
+    const float[:, ::1] probs,
+    list labels,
+    dict adjusted_to_idx,
+    Py_ssize_t prefix_len,
+    float[:, ::1] out,
+):
+    """Set `out[i, adjusted_to_idx[labels[i][j][prefix_len:]]] = probs[i, j]`"""
+    cdef Py_ssize_t i, j
+    cdef Py_ssize_t n_rows = probs.shape[0]
+    cdef Py_ssize_t n_cols = probs.shape[1]
+    cdef object row
+    cdef str label
+    for i in range(n_rows):
+        row = labels[i]
+        for j in range(n_cols):
+            label = row[j]
+            out[i, <Py_ssize_t>adjusted_to_idx[label[prefix_len:]]] = probs[i, j]
@@ -1,18 +1,36 @@
 import json
+import os
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from itertools import chain
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Dict, List, Literal, Union
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, Union
 
-import fasttext
 import numpy as np
 from sklearn.base import BaseEstimator, ClassifierMixin
 from sklearn.exceptions import NotFittedError
 
+from ._mmap import Dictionary, MmapFastText, supports_mmap
+from ._onnx import OnnxPredictor, export_model
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    from ._reorder import reorder as _reorder_probs
+except ImportError:
+    _reorder_probs = None
+
+
+# Characters of a label that can't appear in a fastText label token
+_ADJUST_TABLE = str.maketrans({" ": "_"})
+
 
 def _adjust_label(string: str) -> str:
-    return string.replace(" ", "_")
+    return string.translate(_ADJUST_TABLE)
 
 
 def _check_fit(model):
@@ -23,59 +41,306 @@ def _check_fit(model):
         )
 
 
-StrOrPath = Union[str, Path]
+StrOrPath = Union[str, os.PathLike]
 
+# Buffer size for writing the fastText training file, so that millions of
+# short lines are flushed in a handful of large writes
+_TRAIN_FILE_BUFFER_SIZE = 8 * 1024 * 1024
 
-def convert_path(path: StrOrPath) -> Path:
-    if isinstance(path, Path):
-        return path
-    elif isinstance(path, str):
-        return Path(path)
+# Rows of a multilabel `y` encoded per call of the compiled row encoder
+_ENCODE_CHUNK_ROWS = 65536
+
+# Probability matrices larger than this are reordered by the compiled extension
+_C_REORDER_MIN_SIZE = 65536
+
+
+def _encode_multilabel_rows(y, label_bytes, label_offsets):
+    """Concatenate the encoded label tokens of the positive columns of each row.
+
+    `label_bytes` holds every label token back to back and `label_offsets` the
+    `n_classes + 1` boundaries into it. Returns the byte buffer and the
+    `n_samples + 1` row boundaries into that buffer.
+    """
+    n_rows, n_cols = y.shape
+    row_offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    for i in range(n_rows):
+        size = 0
+        for j in range(n_cols):
+            if y[i, j] == 1:
+                size += label_offsets[j + 1] - label_offsets[j]
+        row_offsets[i + 1] = row_offsets[i] + size
+    buffer = np.empty(row_offsets[n_rows], dtype=np.uint8)
+    for i in range(n_rows):
+        pos = row_offsets[i]
+        for j in range(n_cols):
+            if y[i, j] == 1:
+                start = label_offsets[j]
+                end = label_offsets[j + 1]
+                buffer[pos : pos + end - start] = label_bytes[start:end]
+                pos += end - start
+    return buffer, row_offsets
+
+
+def _get_fasttext():
+    """fastText's C++ extension is heavy, so only import it once a model is needed"""
+    import fasttext
+
+    return fasttext
+
+
+@lru_cache(maxsize=None)
+def _get_row_encoder():
+    """`_encode_multilabel_rows` compiled on first use, or None without numba"""
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True)(_encode_multilabel_rows)
+
+
+def _write_json(path: Path, data) -> None:
+    if orjson is None:
+        path.write_text(json.dumps(data, indent=4), encoding="utf-8")
     else:
-        raise TypeError("Not `str` or `Path`")
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+def _read_json(path: Path):
+    if orjson is None:
+        # orjson writes UTF-8 whatever the locale's encoding is
+        return json.loads(path.read_text(encoding="utf-8"))
+    return orjson.loads(path.read_bytes())
+
+
+def convert_path(path: StrOrPath) -> Path:
+    # `Path` also accepts any `os.PathLike` and raises `TypeError` on anything else
+    return Path(path)
 
 
 class BaseFastTextClassifier(ABC, BaseEstimator, ClassifierMixin):
+    # Set by `load_onnx` to predict with ONNX Runtime instead of fastText
+    _ort: Optional[OnnxPredictor] = None
+
     @abstractmethod
-    def fit(self, X, y) -> "BaseFastTextClassifier":
+    def fit(
+        self, X=None, y=None, corpus_file: Optional[StrOrPath] = None
+    ) -> "BaseFastTextClassifier":
         return self
 
+    @abstractmethod
+    def _check_X_y(self, X, y) -> Tuple[list, np.ndarray]:
+        """`X` as a list and `y` as an array, raise `ValueError` if they don't match"""
+
+    @abstractmethod
+    def _adjust_labels(self, y) -> Dict[str, str]:
+        """The sorted classes of `y` mapped to their adjusted labels"""
+
+    @abstractmethod
+    def _iter_corpus(self, X, y, adjusted_labels: Dict[str, str]) -> Iterator[bytes]:
+        """The lines of the fastText training file of `X` and `y`"""
+
+    def dump_corpus(self, X, y, path: StrOrPath) -> None:
+        """Write the fastText training file of `X` and `y` to `path`.
+
+        Pass it to `fit` as `corpus_file` to skip writing it again on every `fit`,
+        e.g. during a hyperparameter search.
+        """
+        X, y = self._check_X_y(X, y)
+        # The labels are only encoded here, the estimator's own are left as they are
+        adjusted_labels = self._adjust_labels(y)
+        with open(convert_path(path), "wb", buffering=_TRAIN_FILE_BUFFER_SIZE) as f:
+            f.writelines(self._iter_corpus(X, y, adjusted_labels))
+
+    def _fit(self, X, y, corpus_file: Optional[StrOrPath]) -> "BaseFastTextClassifier":
+        # With a `corpus_file`, `X` is unused and `y` only gives the classes
+        if corpus_file is None:
+            X, y = self._check_X_y(X, y)
+        adjusted_labels = self._adjust_labels(y)
+        if corpus_file is not None:
+            self._train(convert_path(corpus_file))
+        else:
+            train_file = NamedTemporaryFile(
+                "wb", buffering=_TRAIN_FILE_BUFFER_SIZE, suffix=".txt", delete=False
+            )
+            try:
+                with train_file as f:
+                    f.writelines(self._iter_corpus(X, y, adjusted_labels))
+                self._train(train_file.name)
+            finally:
+                os.unlink(train_file.name)
+        self.original_labels = list(adjusted_labels)
+        self.adjusted_labels = adjusted_labels
+        self.adjusted_labels_inverse = {v: k for k, v in adjusted_labels.items()}
+        self.classes_ = self.original_labels
+        self._index_labels()
+        self.fitted = True
+        return self
+
+    def _train(self, input_file: StrOrPath) -> None:
+        self.model = _get_fasttext().train_supervised(
+            input=str(input_file),
+            lr=self.lr,
+            dim=self.dim,
+            ws=self.ws,
+            epoch=self.epoch,
+            minCount=self.minCount,
+            minCountLabel=self.minCountLabel,
+            minn=self.minn,
+            maxn=self.maxn,
+            neg=self.neg,
+            wordNgrams=self.wordNgrams,
+            loss=self.loss,
+            bucket=self.bucket,
+            lrUpdateRate=self.lrUpdateRate,
+            t=self.t,
+            label=self.label,
+            verbose=self.verbose,
+            thread=self.thread,
+        )
+        if self.quantize_after_fit:
+            self.model.quantize()
+        self.is_quantized = self.quantize_after_fit
+
     @property
     def n_labels(self):
         _check_fit(self)
         return len(self.classes_)
 
     def predict(self, X):
+        labels, _ = self.predict_top_k(X, 1)
+        return [row_labels[0] for row_labels in labels]
+
+    def predict_top_k(self, X, k: int) -> Tuple[List[List[str]], np.ndarray]:
+        """The `k` most probable classes of each sample, in descending order.
+
+        Cheaper than `predict_proba` when `k` is much smaller than `n_labels`.
+
+        Returns
+        -------
+        labels : list of length n_samples of lists of `k` classes
+
+        probs : ndarray of shape (n_samples, k), the probabilities of `labels`
+        """
         _check_fit(self)
         if isinstance(X, str):
             X = [X]
-        preds = self.model.predict(X, k=1)
-        # Remove the label prefix from the string (e.g. "__label__")
-        labels = [labels[0][len(self.label) :] for labels in preds[0]]
-
-        return labels
+        if self._ort is not None:
+            probs = self._ort.predict_proba(X)
+            top = np.argsort(-probs, axis=1, kind="stable")[:, :k]
+            classes = self.classes_
+            labels = [[classes[i] for i in row] for row in top]
+            return labels, np.take_along_axis(probs, top, axis=1)
+        preds = self.model.predict(X, k=k)
+        # Remove the label prefix (e.g. "__label__") and map back to our classes,
+        # the per-label lookups are bound to locals out of the loops
+        inverse = self.adjusted_labels_inverse
+        prefix_len = self._label_prefix_len
+        labels = [
+            [inverse[label[prefix_len:]] for label in row_labels]
+            for row_labels in preds[0]
+        ]
+        # Shaped explicitly so that an empty `X` still gives a 2d array
+        probs = np.asarray(preds[1], dtype=np.float32)
+        return labels, probs.reshape(len(X), min(k, self.n_labels))
 
     def predict_proba(self, X):
-        # Note: This will be slow because we have to re-sort :(
         # NOTE: This has some sorting error when using cross_val_predict
         _check_fit(self)
         if isinstance(X, str):
             X = [X]
+        if self._ort is not None:
+            return self._ort.predict_proba(X)
+        if self.n_labels == 2 and self.loss in ("softmax", "hs"):
+            return self._predict_proba_binary(X)
         preds = self.model.predict(X, k=self.n_labels)
-        preds_array = np.zeros(shape=(len(X), self.n_labels), dtype=np.float32)
-        for p_i, (labels, probs) in enumerate(zip(*preds)):
-            # The labels are returned in descending order of probs,
-            # we want them consistently ordered by our alphabetic classes
-            label_order = {
-                label: i
-                for i, label in enumerate(label[len(self.label) :] for label in labels)
-            }
-            for l_i, ordered_label in enumerate(self.classes_):
-                preds_array[p_i, l_i] = probs[
-                    label_order[self.adjusted_labels[ordered_label]]
-                ]
+        # Shaped explicitly so that an empty `X` still gives a 2d array
+        probs = np.asarray(preds[1], dtype=np.float32).reshape(len(X), self.n_labels)
+        preds_array = np.empty_like(probs)
+        # The labels are returned in descending order of probs, we want them
+        # consistently ordered by our alphabetic classes
+        if _reorder_probs is not None and probs.size > _C_REORDER_MIN_SIZE:
+            _reorder_probs(
+                probs,
+                list(preds[0]),
+                self._adjusted_to_class_idx,
+                self._label_prefix_len,
+                preds_array,
+            )
+            return preds_array
+        # Without the extension, build one permutation array and scatter the
+        # probabilities in a single call
+        perm = np.empty(probs.shape, dtype=np.intp)
+        class_idx = self._adjusted_to_class_idx
+        prefix_len = self._label_prefix_len
+        for p_i, labels in enumerate(preds[0]):
+            perm[p_i] = [class_idx[label[prefix_len:]] for label in labels]
+        np.put_along_axis(preds_array, perm, probs, axis=1)
         return preds_array
 
+    def _predict_proba_binary(self, X: List[str]) -> np.ndarray:
+        # With two classes whose probabilities sum to one, the top one is enough
+        preds = self.model.predict(X, k=1)
+        class_idx = self._adjusted_to_class_idx
+        prefix_len = self._label_prefix_len
+        top_idx = np.fromiter(
+            (class_idx[labels[0][prefix_len:]] for labels in preds[0]),
+            dtype=np.intp,
+            count=len(X),
+        )
+        top_probs = np.asarray(preds[1], dtype=np.float32).reshape(len(X))
+        rows = np.arange(len(X))
+        preds_array = np.empty((len(X), 2), dtype=np.float32)
+        preds_array[rows, top_idx] = top_probs
+        preds_array[rows, 1 - top_idx] = 1 - top_probs
+        return preds_array
+
+    def export_onnx(self, path: StrOrPath) -> None:
+        """Export to an ONNX model, see `load_onnx`.
+
+        The `ova` and `ns` losses use the exact sigmoid in ONNX where fastText uses a
+        lookup table, so their probabilities differ slightly from fastText's.
+        """
+        _check_fit(self)
+        if self.is_quantized:
+            raise ValueError("Quantized models can't be exported to ONNX.")
+        if self.loss == "hs":
+            raise ValueError("Models with the `hs` loss can't be exported to ONNX.")
+        labels = list(self.model.get_labels())
+        label_rows = {
+            label[self._label_prefix_len :]: i for i, label in enumerate(labels)
+        }
+        class_rows = [label_rows[self.adjusted_labels[c]] for c in self.classes_]
+        # A model loaded by fastText doesn't expose its arguments, use ours
+        dictionary = Dictionary(
+            list(self.model.get_words()),
+            labels,
+            self.bucket,
+            self.minn,
+            self.maxn,
+            self.wordNgrams,
+            label=self.label,
+        )
+        export_model(
+            convert_path(path),
+            self.model.get_input_matrix(),
+            self.model.get_output_matrix()[class_rows],
+            self.loss != "softmax",
+            dictionary,
+            self.classes_,
+        )
+
+    def load_onnx(self, path: StrOrPath) -> "BaseFastTextClassifier":
+        """Predict with ONNX Runtime and a model written by `export_onnx`.
+
+        `predict`, `predict_top_k` and `predict_proba` then bypass fastText.
+        """
+        _check_fit(self)
+        ort = OnnxPredictor(convert_path(path))
+        if ort.classes != list(self.classes_):
+            raise ValueError("The ONNX model was exported with different classes.")
+        self._ort = ort
+        return self
+
     @classmethod
     def sort_labels(cls, y: List[str]) -> List[str]:
         return list(sorted(list(set(y))))
@@ -84,9 +349,10 @@ class BaseFastTextClassifier(ABC, BaseEstimator, ClassifierMixin):
         path = convert_path(path)
         path.mkdir(parents=True, exist_ok=True)
         """Save to a directory"""
-        if quantized:
+        if quantized and not self.is_quantized:
             self.model.quantize()
-        extension = "ftz" if quantized else "bin"
+            self.is_quantized = True
+        extension = "ftz" if self.is_quantized else "bin"
         params = {
             "lr": self.lr,
             "dim": self.dim,
@@ -102,28 +368,44 @@ class BaseFastTextClassifier(ABC, BaseEstimator, ClassifierMixin):
             "bucket": self.bucket,
             "lrUpdateRate": self.lrUpdateRate,
             "t": self.t,
+            "quantize_after_fit": self.quantize_after_fit,
         }
-        (path / "params.json").write_text(json.dumps(params, indent=4))
+        _write_json(path / "params.json", params)
         labels_data = {
             "labels": [
                 {"original": label, "adjusted": self.adjusted_labels[label]}
                 for label in self.original_labels
             ]
         }
-        (path / "labels.json").write_text(json.dumps(labels_data, indent=4))
+        _write_json(path / "labels.json", labels_data)
 
         self.model.save_model(str(path / f"fasttext.{extension}"))
 
     @classmethod
-    def load(cls, path: StrOrPath) -> "FastTextClassifier":
+    def load(cls, path: StrOrPath, mmap: bool = False) -> "FastTextClassifier":
+        """Load from a directory written by `save`.
+
+        With `mmap=True` a `.bin` model is memory-mapped rather than read into
+        memory, so it loads almost instantly and its pages are shared by every
+        process that loads the same file, e.g. the workers of a gunicorn server.
+        Quantized `.ftz` models are small and, like models with the `hs` loss, are
+        always loaded by fastText.
+        """
         path = convert_path(path)
-        params = json.loads((path / "params.json").read_text())
-        labels_data = json.loads((path / "labels.json").read_text())
+        params = _read_json(path / "params.json")
+        labels_data = _read_json(path / "labels.json")
         classes_ = []
         adjusted_labels = {}
-        for label in labels_data["labels"]:
-            classes_.append(label["original"])
-            adjusted_labels[label["original"]] = label["adjusted"]
+        adjusted_labels_inverse = {}
+        class_to_idx = {}
+        adjusted_to_class_idx = {}
+        for i, label in enumerate(labels_data["labels"]):
+            original, adjusted = label["original"], label["adjusted"]
+            classes_.append(original)
+            adjusted_labels[original] = adjusted
+            adjusted_labels_inverse[adjusted] = original
+            class_to_idx[original] = i
+            adjusted_to_class_idx[adjusted] = i
         try:
             model_file = next(
                 chain(path.glob("fasttext.ftz"), path.glob("fasttext.bin"))
@@ -131,20 +413,37 @@ class BaseFastTextClassifier(ABC, BaseEstimator, ClassifierMixin):
         except StopIteration:
             raise ValueError("No file with .bin or .ftz extension in directory.")
         clf = cls(**params)
-        clf.model = fasttext.load_model(str(model_file))
+        clf.model = cls._load_model(model_file, mmap)
         clf.fitted = True
         clf.is_quantized = clf.model.is_quantized()
         clf.classes_ = classes_
         clf.adjusted_labels = adjusted_labels
-        clf.adjusted_labels_inverse = {v: k for k, v in adjusted_labels.items()}
+        clf.adjusted_labels_inverse = adjusted_labels_inverse
+        clf._label_prefix_len = len(clf.label)
+        clf._class_to_idx = class_to_idx
+        clf._adjusted_to_class_idx = adjusted_to_class_idx
 
         return clf
 
+    @staticmethod
+    def _load_model(model_file: Path, mmap: bool):
+        if mmap and model_file.suffix == ".bin" and supports_mmap(model_file):
+            return MmapFastText(model_file)
+        return _get_fasttext().load_model(str(model_file))
+
+    def _index_labels(self) -> None:
+        """Cache the label lookups used at prediction time once `fit` is done"""
+        self._label_prefix_len = len(self.label)
+        self._class_to_idx = {label: i for i, label in enumerate(self.classes_)}
+        self._adjusted_to_class_idx = {
+            self.adjusted_labels[label]: i for i, label in enumerate(self.classes_)
+        }
+
     def _get_original_label(self, adjusted_label: str):
         return self.adjusted_labels_inverse[adjusted_label]
 
     def _get_original_label_index(self, adjusted_label: str):
-        return self.original_labels.index(self._get_original_label(adjusted_label))
+        return self._class_to_idx[self._get_original_label(adjusted_label)]
 
 
 class FastTextClassifier(BaseFastTextClassifier):
@@ -167,6 +466,7 @@ class FastTextClassifier(BaseFastTextClassifier):
         label: str = "__label__",
         verbose: int = 2,
         thread: int = 2,
+        quantize_after_fit: bool = False,
     ):
         self.lr = lr
         self.dim = dim
@@ -185,52 +485,46 @@ class FastTextClassifier(BaseFastTextClassifier):
         self.label = label
         self.verbose = verbose
         self.thread = thread
+        self.quantize_after_fit = quantize_after_fit
         # non-model
         self.fitted = False
         self.is_quantized = False
         self.adjusted_labels: Dict[str, str] = {}
 
-    def fit(self, X, y) -> "FastTextClassifier":
+    def fit(
+        self, X=None, y=None, corpus_file: Optional[StrOrPath] = None
+    ) -> "FastTextClassifier":
         """
         Parameters
         ----------
         X : 1d array-like of length n_samples, the text to be classified
 
         y : 1d array-like of length n_samples, the target classes
+
+        corpus_file : path to a training file written by `dump_corpus` to train on
+        instead of X, y is then only used for the set of classes
         """
-        self.original_labels = self.sort_labels(y)
-        self.adjusted_labels = {
-            label: _adjust_label(label) for label in self.original_labels
-        }
-        self.adjusted_labels_inverse = {v: k for k, v in self.adjusted_labels.items()}
-        with NamedTemporaryFile() as train_file:
-            with open(train_file.name, "a") as f:
-                for text, label in zip(X, y):
-                    f.write(f"{self.label}{self.adjusted_labels[label]} {text}\n")
-
-            self.model = fasttext.train_supervised(
-                input=train_file.name,
-                lr=self.lr,
-                dim=self.dim,
-                ws=self.ws,
-                epoch=self.epoch,
-                minCount=self.minCount,
-                minCountLabel=self.minCountLabel,
-                minn=self.minn,
-                maxn=self.maxn,
-                neg=self.neg,
-                wordNgrams=self.wordNgrams,
-                loss=self.loss,
-                bucket=self.bucket,
-                lrUpdateRate=self.lrUpdateRate,
-                t=self.t,
-                label=self.label,
-                verbose=self.verbose,
-                thread=self.thread,
-            )
-        self.classes_ = self.original_labels
-        self.fitted = True
-        return self
+        if y is None:
+            raise ValueError("`y` is needed for the classes, also with `corpus_file`.")
+        return self._fit(X, y, corpus_file)
+
+    def _check_X_y(self, X, y) -> Tuple[list, np.ndarray]:
+        y = np.asarray(y, dtype=object)
+        if y.ndim != 1:
+            raise ValueError(f"`y` must be 1d, got shape {y.shape}.")
+        X = list(X)
+        if len(X) != len(y):
+            raise ValueError(f"`X` has {len(X)} samples but `y` has {len(y)}.")
+        return X, y
+
+    def _adjust_labels(self, y) -> Dict[str, str]:
+        return {label: _adjust_label(label) for label in self.sort_labels(y)}
+
+    def _iter_corpus(self, X, y, adjusted_labels: Dict[str, str]) -> Iterator[bytes]:
+        prefix = self.label.encode()
+        label_tokens = {k: v.encode() for k, v in adjusted_labels.items()}
+        for text, label in zip(X, y):
+            yield prefix + label_tokens[label] + b" " + text.encode() + b"\n"
 
 
 class FastTextMultiOutputClassifier(BaseFastTextClassifier):
@@ -253,6 +547,7 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
         label: str = "__label__",
         verbose: int = 2,
         thread: int = 2,
+        quantize_after_fit: bool = False,
     ):
         self.labels = labels
         self.lr = lr
@@ -272,12 +567,15 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
         self.label = label
         self.verbose = verbose
         self.thread = thread
+        self.quantize_after_fit = quantize_after_fit
         # non-model
         self.fitted = False
         self.is_quantized = False
         self.adjusted_labels: Dict[str, str] = {}
 
-    def fit(self, X, y) -> "FastTextMultiOutputClassifier":
+    def fit(
+        self, X=None, y=None, corpus_file: Optional[StrOrPath] = None
+    ) -> "FastTextMultiOutputClassifier":
         """
         Parameters
         ----------
@@ -287,56 +585,53 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
         is positive and 0 indicates that the class is negative, e.g., output of
         sklearn.preprocessing.MultiLabelBinarizer.
 
+        corpus_file : path to a training file written by `dump_corpus` to train on
+        instead of X and y
+
         labels: list-like of length n_classes, the labels corresponding to the
         columns of Y
         """
-        self.original_labels = self.sort_labels(self.labels)
-        self.adjusted_labels = {
-            label: _adjust_label(label) for label in self.original_labels
-        }
-        self.adjusted_labels_inverse = {v: k for k, v in self.adjusted_labels.items()}
-
-        def row_to_labels(row, original_labels, adjusted_labels):
-            return " ".join(
-                [
-                    f"{self.label}{adjusted_labels[original_labels[i]]}"
-                    for i, value in enumerate(row)
-                    if value == 1
-                ]
-            )
-
-        self.multilabels = [
-            row_to_labels(row, self.original_labels, self.adjusted_labels) for row in y
-        ]
+        return self._fit(X, y, corpus_file)
 
-        with NamedTemporaryFile() as train_file:
-            with open(train_file.name, "a") as f:
-                for text, multilabel in zip(X, self.multilabels):
-                    f.write(f"{multilabel} {text}\n")
-
-            self.model = fasttext.train_supervised(
-                input=train_file.name,
-                lr=self.lr,
-                dim=self.dim,
-                ws=self.ws,
-                epoch=self.epoch,
-                minCount=self.minCount,
-                minCountLabel=self.minCountLabel,
-                minn=self.minn,
-                maxn=self.maxn,
-                neg=self.neg,
-                wordNgrams=self.wordNgrams,
-                loss=self.loss,
-                bucket=self.bucket,
-                lrUpdateRate=self.lrUpdateRate,
-                t=self.t,
-                label=self.label,
-                verbose=self.verbose,
-                thread=self.thread,
+    def _check_X_y(self, X, y) -> Tuple[list, np.ndarray]:
+        y = np.ascontiguousarray(y, dtype=np.int8)
+        if y.ndim != 2 or y.shape[1] != len(self.labels):
+            raise ValueError(
+                f"`y` must have shape (n_samples, {len(self.labels)}), got {y.shape}."
             )
-        self.classes_ = self.original_labels
-        self.fitted = True
-        return self
+        X = list(X)
+        if len(X) != len(y):
+            raise ValueError(f"`X` has {len(X)} samples but `y` has {len(y)}.")
+        return X, y
+
+    def _adjust_labels(self, y) -> Dict[str, str]:
+        return {label: _adjust_label(label) for label in self.sort_labels(self.labels)}
+
+    def _iter_corpus(self, X, y, adjusted_labels: Dict[str, str]) -> Iterator[bytes]:
+        for text, multilabel in zip(X, self._iter_multilabels(y, adjusted_labels)):
+            yield multilabel + text.encode() + b"\n"
+
+    def _iter_multilabels(self, y, adjusted_labels: Dict[str, str]) -> Iterator[bytes]:
+        """Encode each row of `y` as its label tokens, each followed by a space"""
+        y = np.ascontiguousarray(y, dtype=np.int8)
+        label_tokens = tuple(
+            f"{self.label}{adjusted} ".encode() for adjusted in adjusted_labels.values()
+        )
+        encode_rows = _get_row_encoder()
+        if encode_rows is None:
+            # Only visit the positive columns of each row
+            for row in y:
+                yield b"".join(label_tokens[i] for i in np.flatnonzero(row == 1))
+            return
+        label_offsets = np.zeros(len(label_tokens) + 1, dtype=np.int64)
+        label_offsets[1:] = np.cumsum([len(token) for token in label_tokens])
+        label_bytes = np.frombuffer(b"".join(label_tokens), dtype=np.uint8)
+        # Encode a chunk of rows at a time, so only one chunk's buffer is in memory
+        for chunk_start in range(0, len(y), _ENCODE_CHUNK_ROWS):
+            chunk = y[chunk_start : chunk_start + _ENCODE_CHUNK_ROWS]
+            buffer, row_offsets = encode_rows(chunk, label_bytes, label_offsets)
+            for start, end in zip(row_offsets[:-1], row_offsets[1:]):
+                yield buffer[start:end].tobytes()
 
     def predict(self, X):
         # Predicting a single class doesn't make sense in the multilabel context
@@ -346,9 +641,10 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
         path = convert_path(path)
         path.mkdir(parents=True, exist_ok=True)
         """Save to a directory"""
-        if quantized:
+        if quantized and not self.is_quantized:
             self.model.quantize()
-        extension = "ftz" if quantized else "bin"
+            self.is_quantized = True
+        extension = "ftz" if self.is_quantized else "bin"
         params = {
             "labels": self.labels,
             "lr": self.lr,
@@ -364,28 +660,36 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
             "bucket": self.bucket,
             "lrUpdateRate": self.lrUpdateRate,
             "t": self.t,
+            "quantize_after_fit": self.quantize_after_fit,
         }
-        (path / "params.json").write_text(json.dumps(params, indent=4))
+        _write_json(path / "params.json", params)
         labels_data = {
             "labels": [
                 {"original": label, "adjusted": self.adjusted_labels[label]}
                 for label in self.original_labels
             ]
         }
-        (path / "labels.json").write_text(json.dumps(labels_data, indent=4))
+        _write_json(path / "labels.json", labels_data)
 
         self.model.save_model(str(path / f"fasttext.{extension}"))
 
     @classmethod
-    def load(cls, path: StrOrPath) -> "FastTextClassifier":
+    def load(cls, path: StrOrPath, mmap: bool = False) -> "FastTextClassifier":
         path = convert_path(path)
-        params = json.loads((path / "params.json").read_text())
-        labels_data = json.loads((path / "labels.json").read_text())
+        params = _read_json(path / "params.json")
+        labels_data = _read_json(path / "labels.json")
         classes_ = []
         adjusted_labels = {}
-        for label in labels_data["labels"]:
-            classes_.append(label["original"])
-            adjusted_labels[label["original"]] = label["adjusted"]
+        adjusted_labels_inverse = {}
+        class_to_idx = {}
+        adjusted_to_class_idx = {}
+        for i, label in enumerate(labels_data["labels"]):
+            original, adjusted = label["original"], label["adjusted"]
+            classes_.append(original)
+            adjusted_labels[original] = adjusted
+            adjusted_labels_inverse[adjusted] = original
+            class_to_idx[original] = i
+            adjusted_to_class_idx[adjusted] = i
         try:
             model_file = next(
                 chain(path.glob("fasttext.ftz"), path.glob("fasttext.bin"))
@@ -393,11 +697,14 @@ class FastTextMultiOutputClassifier(BaseFastTextClassifier):
         except StopIteration:
             raise ValueError("No file with .bin or .ftz extension in directory.")
         clf = cls(**params)
-        clf.model = fasttext.load_model(str(model_file))
+        clf.model = cls._load_model(model_file, mmap)
         clf.fitted = True
         clf.is_quantized = clf.model.is_quantized()
         clf.classes_ = classes_
         clf.adjusted_labels = adjusted_labels
-        clf.adjusted_labels_inverse = {v: k for k, v in adjusted_labels.items()}
+        clf.adjusted_labels_inverse = adjusted_labels_inverse
+        clf._label_prefix_len = len(clf.label)
+        clf._class_to_idx = class_to_idx
+        clf._adjusted_to_class_idx = adjusted_to_class_idx
 
         return clf
@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from fasttext_lite import FastTextClassifier, FastTextMultiOutputClassifier
+from fasttext_lite import FastTextClassifier, FastTextMultiOutputClassifier, core
 
 
 @pytest.fixture
@@ -209,6 +209,374 @@ def test_multiclass_labels(sentences):
     labels = ["Label 1", "Label 2", "Label 3"]
     clf = FastTextMultiOutputClassifier(labels=labels)
     clf.fit(X, Y)
-    assert clf.multilabels[1] == "__label__Label_1"
-    assert clf.multilabels[2] == "__label__Label_1 __label__Label_2"
-    assert clf.multilabels[4] == "__label__Label_1 __label__Label_2 __label__Label_3"
+    multilabels = list(clf._iter_multilabels(Y, clf.adjusted_labels))
+    assert multilabels[1] == b"__label__Label_1 "
+    assert multilabels[2] == b"__label__Label_1 __label__Label_2 "
+    assert multilabels[4] == b"__label__Label_1 __label__Label_2 __label__Label_3 "
+
+
+class _StubModel:
+    """Distinct probabilities in a different label order for each row, unlike the
+    batched `predict` of fastText 0.9.2, which repeats the top probability"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def predict(self, X, k=1):
+        n = len(self.labels)
+        orders = [np.roll(np.arange(n), i) for i in range(len(X))]
+        probs = np.linspace(0.9, 0.1, n, dtype=np.float32)
+        return [[self.labels[j] for j in order] for order in orders], [probs for _ in X]
+
+
+def test_predict_proba_order(sentences):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25)
+    clf.fit(X, y)
+    clf.model = _StubModel(list(clf.model.get_labels()))
+    X_test = ["first", "second", "third"]
+    pp = clf.predict_proba(X_test)
+    assert pp.shape == (len(X_test), 3)
+    labels, probs = clf.model.predict(X_test, k=3)
+    for row, (row_labels, row_probs) in enumerate(zip(labels, probs)):
+        for label, prob in zip(row_labels, row_probs):
+            adjusted = label[len(clf.label) :]
+            idx = clf.classes_.index(clf.adjusted_labels_inverse[adjusted])
+            assert pp[row, idx] == prob
+
+
+def test_multiclass_labels_without_numba(sentences, monkeypatch):
+    X = sentences
+    label_1 = np.ones(len(X))
+    label_2 = np.array([1 if i % 2 == 0 else 0 for i in range(len(X))])
+    label_3 = np.array([1 if i % 4 == 0 else 0 for i in range(len(X))])
+    Y = np.column_stack((label_1, label_2, label_3))
+    labels = ["Label 1", "Label 2", "Label 3"]
+    clf = FastTextMultiOutputClassifier(labels=labels)
+    clf.fit(X, Y)
+    multilabels = list(clf._iter_multilabels(Y, clf.adjusted_labels))
+    monkeypatch.setattr(core, "_get_row_encoder", lambda: None)
+    assert list(clf._iter_multilabels(Y, clf.adjusted_labels)) == multilabels
+
+
+def test_multiclass_labels_chunks(sentences, monkeypatch):
+    X = sentences
+    label_2 = np.array([1 if i % 2 == 0 else 0 for i in range(len(X))])
+    label_3 = np.array([1 if i % 4 == 0 else 0 for i in range(len(X))])
+    Y = np.column_stack((np.ones(len(X)), label_2, label_3))
+    clf = FastTextMultiOutputClassifier(labels=["Label 1", "Label 2", "Label 3"])
+    clf.fit(X, Y)
+    multilabels = list(clf._iter_multilabels(Y, clf.adjusted_labels))
+    monkeypatch.setattr(core, "_ENCODE_CHUNK_ROWS", 7)
+    assert list(clf._iter_multilabels(Y, clf.adjusted_labels)) == multilabels
+
+
+def test_save_load_mmap(sentences, tmp_path):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, wordNgrams=2, minn=2, maxn=4, bucket=10000)
+    clf.fit(X, y)
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    clf.save(str(tmp_path))
+    clf2 = FastTextClassifier.load(str(tmp_path))
+    clf3 = FastTextClassifier.load(str(tmp_path), mmap=True)
+    assert isinstance(clf3.model, core.MmapFastText)
+    assert not clf3.is_quantized
+    with pytest.raises(ValueError):
+        clf3.save(str(tmp_path / "quantized"), quantized=True)
+    assert clf2.predict(X_test) == clf3.predict(X_test)
+    # fastText's batched predict reports the top probability for every label,
+    # so only the top probabilities are comparable
+    assert np.allclose(
+        clf2.predict_proba(X_test).max(axis=1), clf3.predict_proba(X_test).max(axis=1)
+    )
+
+
+def test_save_load_mmap_hs(sentences, tmp_path):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, loss="hs")
+    clf.fit(X, y)
+    clf.save(str(tmp_path))
+    clf2 = FastTextClassifier.load(str(tmp_path), mmap=True)
+    assert not isinstance(clf2.model, core.MmapFastText)
+    assert clf2.predict(sentences) == clf.predict(sentences)
+
+
+def test_multiclass_save_load_mmap(sentences, tmp_path):
+    X = sentences
+    label_1 = np.ones(len(X))
+    label_2 = np.array([1 if i % 2 == 0 else 0 for i in range(len(X))])
+    label_3 = np.array([1 if i % 4 == 0 else 0 for i in range(len(X))])
+    Y = np.column_stack((label_1, label_2, label_3))
+    labels = ["Label 1", "Label 2", "Label 3"]
+    clf = FastTextMultiOutputClassifier(labels=labels, epoch=25)
+    clf.fit(X, Y)
+    clf.save(str(tmp_path))
+    clf2 = FastTextMultiOutputClassifier.load(str(tmp_path), mmap=True)
+    X_test = ["This is a sentence to predict on", "this is another sentence"]
+    assert np.allclose(
+        clf.predict_proba(X_test).max(axis=1), clf2.predict_proba(X_test).max(axis=1)
+    )
+
+
+def test_quantize_after_fit(sentences, tmp_path):
+    X = sentences
+    y = ["Label 1" if i % 2 == 0 else "Label 2" for i in range(len(X))]
+    clf = FastTextClassifier(quantize_after_fit=True)
+    clf.fit(X, y)
+    assert clf.is_quantized
+    assert clf.model.is_quantized()
+    clf.save(str(tmp_path))
+    assert (tmp_path / "fasttext.ftz").exists()
+    clf2 = FastTextClassifier.load(str(tmp_path))
+    assert clf2.quantize_after_fit
+    assert clf2.is_quantized
+    X_test = ["This is a sentence to predict on"]
+    assert clf.predict(X_test) == clf2.predict(X_test)
+
+
+def test_predict_top_k(sentences):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25)
+    clf.fit(X, y)
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    labels, probs = clf.predict_top_k(X_test, 2)
+    assert probs.shape == (len(X_test), 2)
+    assert all(len(row) == 2 and set(row) <= set(clf.classes_) for row in labels)
+    assert [row[0] for row in labels] == clf.predict(X_test)
+
+
+def test_predict_empty(sentences):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=5)
+    clf.fit(X, y)
+    assert clf.predict_proba([]).shape == (0, 3)
+    labels, probs = clf.predict_top_k([], 2)
+    assert labels == [] and probs.shape == (0, 2)
+    assert clf.predict([]) == []
+
+
+def test_save_load_without_orjson(sentences, tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "orjson", None)
+    X = sentences
+    y = ["FIRST LABEL" if i % 2 == 0 else "SECOND LABEL" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=10)
+    clf.fit(X, y)
+    clf.save(str(tmp_path))
+    clf2 = FastTextClassifier.load(str(tmp_path))
+    assert clf2.get_params() == clf.get_params()
+    assert clf2.classes_ == clf.classes_
+    assert clf2.adjusted_labels == clf.adjusted_labels
+
+
+def test_save_with_orjson_load_without(sentences, tmp_path, monkeypatch):
+    pytest.importorskip("orjson")
+    X = sentences
+    y = ["ÉTIQUETTE UN" if i % 2 == 0 else "ラベル" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=10)
+    clf.fit(X, y)
+    clf.save(str(tmp_path))
+    monkeypatch.setattr(core, "orjson", None)
+    clf2 = FastTextClassifier.load(str(tmp_path))
+    assert clf2.classes_ == clf.classes_
+    assert clf2.adjusted_labels == clf.adjusted_labels
+
+
+def test_predict_proba_binary(sentences):
+    X = sentences
+    y = ["Label 1" if i % 2 == 0 else "Label 2" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25)
+    clf.fit(X, y)
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    pp = clf.predict_proba(X_test)
+    assert pp.shape == (len(X_test), 2)
+    assert np.allclose(pp.sum(axis=1), 1)
+    labels, probs = clf.predict_top_k(X_test, 1)
+    for row, (row_labels, row_probs) in enumerate(zip(labels, probs)):
+        assert np.isclose(pp[row, clf.classes_.index(row_labels[0])], row_probs[0])
+    assert clf.predict_proba([]).shape == (0, 2)
+
+
+def test_export_load_onnx(sentences, tmp_path):
+    pytest.importorskip("onnxruntime")
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, wordNgrams=2, minn=2, maxn=4, bucket=10000)
+    clf.fit(X, y)
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    clf.save(str(tmp_path))
+    clf.export_onnx(tmp_path / "model.onnx")
+    clf_mmap = FastTextClassifier.load(str(tmp_path), mmap=True)
+    clf_onnx = FastTextClassifier.load(str(tmp_path)).load_onnx(tmp_path / "model.onnx")
+    assert clf_onnx.predict(X_test) == clf_mmap.predict(X_test)
+    assert np.allclose(
+        clf_onnx.predict_proba(X_test), clf_mmap.predict_proba(X_test), atol=1e-4
+    )
+    labels, probs = clf_onnx.predict_top_k(X_test, 2)
+    assert [row[0] for row in labels] == clf_onnx.predict(X_test)
+    assert probs.shape == (len(X_test), 2)
+
+
+def test_onnx_predict_chunks(sentences, tmp_path, monkeypatch):
+    onnx_module = pytest.importorskip("fasttext_lite._onnx")
+    pytest.importorskip("onnxruntime")
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, wordNgrams=2, maxn=3, bucket=10000)
+    clf.fit(X, y)
+    clf.export_onnx(tmp_path / "model.onnx")
+    clf.load_onnx(tmp_path / "model.onnx")
+    X_test = X + ["", " ".join(X)]
+    pp = clf.predict_proba(X_test)
+    monkeypatch.setattr(onnx_module, "MAX_GATHERED_IDS", 8)
+    assert np.allclose(clf.predict_proba(X_test), pp, atol=1e-6)
+
+
+def test_export_onnx_from_loaded(sentences, tmp_path):
+    pytest.importorskip("onnxruntime")
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, wordNgrams=2, maxn=3, bucket=10000)
+    clf.fit(X, y)
+    clf.save(str(tmp_path))
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    for mmap in (False, True):
+        loaded = FastTextClassifier.load(str(tmp_path), mmap=mmap)
+        loaded.export_onnx(tmp_path / "model.onnx")
+        loaded.load_onnx(tmp_path / "model.onnx")
+        assert loaded.predict(X_test) == clf.predict(X_test)
+
+
+def test_export_onnx_label_prefix(sentences, tmp_path):
+    pytest.importorskip("onnxruntime")
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25, maxn=3, bucket=10000, label="@@")
+    clf.fit(X, y)
+    # fastText drops unknown tokens starting with the label prefix
+    X_test = ["This is a sentence @@unknown", "She went to the beach @@Label_1"]
+    expected = clf.predict_proba(X_test).max(axis=1)
+    clf.export_onnx(tmp_path / "model.onnx")
+    clf.load_onnx(tmp_path / "model.onnx")
+    assert clf._ort.dictionary.get_line("@@unknown") == clf._ort.dictionary.get_line("")
+    # fastText reports its probabilities plus 1e-5
+    probs = clf.predict_proba(X_test).max(axis=1) + 1e-5
+    assert np.allclose(probs, expected, atol=1e-6)
+
+
+def test_multiclass_export_load_onnx(sentences, tmp_path):
+    pytest.importorskip("onnxruntime")
+    X = sentences
+    label_1 = np.ones(len(X))
+    label_2 = np.array([1 if i % 2 == 0 else 0 for i in range(len(X))])
+    label_3 = np.array([1 if i % 4 == 0 else 0 for i in range(len(X))])
+    Y = np.column_stack((label_1, label_2, label_3))
+    labels = ["Label 1", "Label 2", "Label 3"]
+    clf = FastTextMultiOutputClassifier(labels=labels, epoch=25)
+    clf.fit(X, Y)
+    clf.save(str(tmp_path))
+    clf.export_onnx(tmp_path / "model.onnx")
+    clf_mmap = FastTextMultiOutputClassifier.load(str(tmp_path), mmap=True)
+    clf.load_onnx(tmp_path / "model.onnx")
+    X_test = ["This is a sentence to predict on", "this is another sentence"]
+    # fastText approximates the sigmoid with a lookup table
+    assert np.allclose(
+        clf.predict_proba(X_test), clf_mmap.predict_proba(X_test), atol=1e-2
+    )
+
+
+def test_fit_corpus_file(sentences, tmp_path):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    X_test = [
+        "This is a sentence to predict on",
+        "She went to the beach over the weekend.",
+    ]
+    clf = FastTextClassifier(epoch=25, thread=1)
+    clf.fit(X, y)
+    clf2 = FastTextClassifier(epoch=25, thread=1)
+    clf2.dump_corpus(X, y, tmp_path / "corpus.txt")
+    clf2.fit(y=y, corpus_file=tmp_path / "corpus.txt")
+    assert clf2.classes_ == clf.classes_
+    assert np.allclose(clf.predict_proba(X_test), clf2.predict_proba(X_test))
+
+
+def test_multiclass_fit_corpus_file(sentences, tmp_path):
+    X = sentences
+    label_1 = np.ones(len(X))
+    label_2 = np.array([1 if i % 2 == 0 else 0 for i in range(len(X))])
+    label_3 = np.array([1 if i % 4 == 0 else 0 for i in range(len(X))])
+    Y = np.column_stack((label_1, label_2, label_3))
+    labels = ["Label 1", "Label 2", "Label 3"]
+    clf = FastTextMultiOutputClassifier(labels=labels, thread=1)
+    clf.fit(X, Y)
+    clf2 = FastTextMultiOutputClassifier(labels=labels, thread=1)
+    clf2.dump_corpus(X, Y, tmp_path / "corpus.txt")
+    clf2.fit(corpus_file=tmp_path / "corpus.txt")
+    X_test = ["This is a sentence to predict on", "this is another sentence"]
+    assert np.allclose(clf.predict_proba(X_test), clf2.predict_proba(X_test))
+
+
+def test_predict_proba_compiled_reorder(sentences, monkeypatch):
+    pytest.importorskip("fasttext_lite._reorder")
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25)
+    clf.fit(X, y)
+    clf.model = _StubModel(list(clf.model.get_labels()))
+    monkeypatch.setattr(core, "_C_REORDER_MIN_SIZE", 0)
+    pp = clf.predict_proba(sentences)
+    monkeypatch.setattr(core, "_reorder_probs", None)
+    expected = clf.predict_proba(sentences)
+    assert len(np.unique(expected[:, 0])) == 3
+    assert np.array_equal(pp, expected)
+
+
+def test_fit_validates_y(sentences):
+    X = sentences
+    with pytest.raises(ValueError):
+        FastTextClassifier().fit(X, [[f"Label {i % 3}"] for i in range(len(X))])
+    with pytest.raises(ValueError):
+        FastTextClassifier().fit(X, ["Label 1"] * (len(X) - 1))
+    labels = ["Label 1", "Label 2", "Label 3"]
+    with pytest.raises(ValueError):
+        FastTextMultiOutputClassifier(labels=labels).fit(X, np.ones((len(X), 2)))
+    with pytest.raises(ValueError):
+        FastTextMultiOutputClassifier(labels=labels).fit(X, np.ones((len(X) - 1, 3)))
+    Y = [[1, i % 2, i % 4 == 0] for i in range(len(X))]
+    clf = FastTextMultiOutputClassifier(labels=labels, epoch=25)
+    clf.fit(X, Y)
+    assert clf.predict_proba(X).shape == (len(X), 3)
+
+
+def test_dump_corpus_keeps_fitted_labels(sentences, tmp_path):
+    X = sentences
+    y = [f"Label {i % 3}" for i in range(len(X))]
+    clf = FastTextClassifier(epoch=25)
+    clf.fit(X, y)
+    adjusted_labels = clf.adjusted_labels
+    clf.dump_corpus(X, [f"Label {i % 4}" for i in range(len(X))], tmp_path / "c.txt")
+    assert clf.adjusted_labels == adjusted_labels
+    clf.save(tmp_path / "model")
+    clf2 = FastTextClassifier.load(tmp_path / "model")
+    assert clf2.classes_ == clf.classes_
+    assert clf2.predict_proba(X).shape == (len(X), clf2.n_labels)